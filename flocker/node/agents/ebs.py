@@ -11,6 +11,7 @@ import threading
 import time
 import logging
 import itertools
+import random
 
 import boto3
 
@@ -58,6 +59,13 @@ METADATA_VERSION_LABEL = u'flocker-metadata-version'
 CLUSTER_ID_LABEL = u'flocker-cluster-id'
 BOTO_NUM_RETRIES = 20
 VOLUME_STATE_CHANGE_TIMEOUT = 300
+# Initial and maximum ceiling, in seconds, of the randomized delay between
+# polls of a volume's state.
+VOLUME_STATE_POLL_BASE = 1.0
+VOLUME_STATE_POLL_CAP = 10.0
+# Seconds to wait for other volume state lookups to join a batched
+# ``DescribeVolumes`` request.
+DESCRIBE_VOLUMES_BATCH_DELAY = 0.3
 MAX_ATTACH_RETRIES = 3
 
 # Minimum IOPS per second for a provisioned IOPS volume.
@@ -605,6 +613,146 @@ def _blockdevicevolume_from_ebs_volume(ebs_volume):
     )
 
 
+class _DescribeVolumesBatch(object):
+    """
+    Volume identifiers to be looked up with a single ``DescribeVolumes``
+    request, and the result of that request.
+
+    :ivar client: The EC2 client to make the request with.
+    :ivar set volume_ids: The identifiers of the volumes to look up.
+    :ivar threading.Event done: Set once the request has completed.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.volume_ids = set()
+        self.done = threading.Event()
+        self._volumes = {}
+        self._metadata = {}
+        self._error = None
+
+    def flush(self):
+        """
+        Look up all of the volumes in the batch.
+        """
+        try:
+            # Filtering by identifier, rather than passing ``VolumeIds``,
+            # means a missing volume is omitted from the response instead of
+            # failing the lookup of every other volume in the batch.
+            response = self.client.describe_volumes(
+                Filters=[
+                    dict(Name='volume-id', Values=sorted(self.volume_ids))
+                ]
+            )
+        except Exception as e:
+            self._error = e
+        else:
+            self._volumes = dict(
+                (volume['VolumeId'], volume) for volume in response['Volumes']
+            )
+            self._metadata = response.get('ResponseMetadata', {})
+        finally:
+            self.done.set()
+
+    def result(self, volume_id):
+        """
+        :param unicode volume_id: The identifier of a volume in the batch.
+
+        :raises ClientError: If the request failed or the volume does not
+            exist.
+        :returns: The ``DescribeVolumes`` data for the volume.
+        """
+        if self._error is not None:
+            raise self._error
+        try:
+            return self._volumes[volume_id]
+        except KeyError:
+            raise ClientError(
+                dict(
+                    Error=dict(
+                        Code=NOT_FOUND,
+                        Message=u"The volume '{}' does not exist.".format(
+                            volume_id
+                        ),
+                    ),
+                    ResponseMetadata=dict(
+                        RequestId=self._metadata.get('RequestId', u''),
+                    ),
+                ),
+                'DescribeVolumes',
+            )
+
+
+class _DescribeVolumesBatcher(object):
+    """
+    Coalesce lookups of volumes made from different threads within a short
+    window into one ``DescribeVolumes`` request per EC2 client.
+
+    The first lookup to arrive makes the request on behalf of all lookups
+    that join it.  If other lookups for the same client are already in
+    progress, it first waits ``max_delay`` seconds for more to join;
+    otherwise it makes the request immediately, so a lone caller is not
+    delayed.
+    """
+    def __init__(self, max_delay=DESCRIBE_VOLUMES_BATCH_DELAY,
+                 sleep=time.sleep):
+        """
+        :param float max_delay: Seconds to wait for lookups to join a batch.
+        :param callable sleep: A replacement for ``time.sleep``.
+        """
+        self._max_delay = max_delay
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._batches = {}
+        # Number of lookups in progress for each client.
+        self._lookups = {}
+
+    def describe(self, volume):
+        """
+        Look up the latest data for a volume.
+
+        :param boto3.resources.factory.ec2.Volume volume: The volume.
+
+        :raises ClientError: If the volume could not be looked up.
+        :returns: The ``DescribeVolumes`` data for the volume.
+        """
+        client = volume.meta.client
+        with self._lock:
+            self._lookups[client] = self._lookups.get(client, 0) + 1
+            batch = self._batches.get(client)
+            leader = batch is None
+            if leader:
+                batch = self._batches[client] = _DescribeVolumesBatch(client)
+                wait = self._lookups[client] > 1
+            batch.volume_ids.add(volume.id)
+
+        try:
+            if leader:
+                try:
+                    if wait:
+                        self._sleep(self._max_delay)
+                finally:
+                    # Whatever happens, close the batch and release any
+                    # lookups waiting on it.
+                    with self._lock:
+                        self._batches.pop(client, None)
+                    batch.flush()
+            else:
+                batch.done.wait()
+            return batch.result(volume.id)
+        finally:
+            with self._lock:
+                self._lookups[client] -= 1
+                if not self._lookups[client]:
+                    del self._lookups[client]
+
+
+# A ``_DescribeVolumesBatcher`` through which to refresh volume states, or
+# ``None`` to refresh each volume with its own request.  Batching can delay a
+# lookup made while others are in progress, so it is only enabled where many
+# volumes are polled at once, such as by the functional tests.
+_DESCRIBE_VOLUMES_BATCHER = None
+
+
 @boto3_log
 def _get_ebs_volume_state(volume):
     """
@@ -616,7 +764,11 @@ def _get_ebs_volume_state(volume):
     :rtype: boto3.resources.factory.ec2.Volume
 
     """
-    volume.reload()
+    batcher = _DESCRIBE_VOLUMES_BATCHER
+    if batcher is None:
+        volume.reload()
+    else:
+        volume.meta.data = batcher.describe(volume)
     return volume
 
 
@@ -696,10 +848,37 @@ def _reached_end_state(
         return True
 
 
+def _full_jitter_backoff(base, cap, max_attempts=None):
+    """
+    Generate delays growing exponentially from ``base`` up to ``cap``, each
+    one picked uniformly at random between zero and the current ceiling
+    ("full jitter").  Spreading polls out this way keeps the number of EC2
+    API requests down while a volume is slow to change state.
+
+    :param float base: Ceiling of the first delay, in seconds.
+    :param float cap: Maximum ceiling of any delay, in seconds.
+    :param max_attempts: Number of delays to generate, or ``None`` for no
+        limit.
+
+    :returns: A generator of floats.
+    """
+    if max_attempts is None:
+        attempts = itertools.count()
+    else:
+        attempts = xrange(max_attempts)
+    ceiling = min(cap, base)
+    for _ in attempts:
+        yield random.uniform(0, ceiling)
+        ceiling = min(cap, ceiling * 2)
+
+
 def _wait_for_volume_state_change(operation,
                                   volume,
                                   update=_get_ebs_volume_state,
-                                  timeout=VOLUME_STATE_CHANGE_TIMEOUT):
+                                  timeout=VOLUME_STATE_CHANGE_TIMEOUT,
+                                  base=VOLUME_STATE_POLL_BASE,
+                                  cap=VOLUME_STATE_POLL_CAP,
+                                  max_attempts=None):
     """
     Helper function to wait for a given volume to change state
     from ``start_status`` via ``transient_status`` to ``end_status``.
@@ -709,9 +888,15 @@ def _wait_for_volume_state_change(operation,
     :param boto3.resources.factory.ec2.Volume: Volume to check status for.
     :param update: Method to use to fetch EBS volume's latest state.
     :param int timeout: Seconds to wait for volume operation to succeed.
+    :param float base: Ceiling of the first delay between polls, in seconds.
+    :param float cap: Maximum ceiling of any delay between polls, in seconds.
+    :param max_attempts: Maximum number of polls to make after the first
+        one, or ``None`` to poll until ``timeout`` expires.
 
     :raises Exception: When input volume fails to reach expected backend
         state for given operation within timeout seconds.
+    :raises LoopExceeded: When input volume fails to reach expected backend
+        state for given operation within ``max_attempts`` polls.
     """
     # It typically takes a few seconds for anything to happen, so start
     # out sleeping a little before doing initial check to reduce
@@ -726,7 +911,7 @@ def _wait_for_volume_state_change(operation,
         lambda: _reached_end_state(
             operation, volume, update, time.time() - start_time, timeout
         ),
-        itertools.repeat(1)
+        _full_jitter_backoff(base, cap, max_attempts)
     )
 
 
@@ -11,7 +11,7 @@ from datetime import timedelta
 
 from botocore.exceptions import ClientError
 
-from testtools.matchers import AllMatch, ContainsAll
+from testtools.matchers import AllMatch, ContainsAll, raises
 
 from twisted.python.constants import Names, NamedConstant
 from eliot.testing import (
@@ -21,13 +21,17 @@ from eliot.testing import (
 
 from ..blockdevice import MandatoryProfiles
 
+from .. import ebs
 from ..ebs import (
-    _wait_for_volume_state_change,
-    VolumeOperations, VolumeStateTable, VolumeStates,
+    _wait_for_volume_state_change, _DescribeVolumesBatcher,
+    VolumeOperations, VOLUME_STATE_TABLE, VolumeStates,
     TimeoutException, _reached_end_state, UnexpectedStateException,
     EBSMandatoryProfileAttributes, _get_volume_tag,
-    AttachUnexpectedInstance, VolumeBusy, _next_device,
+    AttachUnexpectedInstance, VolumeBusy, _next_device, _full_jitter_backoff,
+    NOT_FOUND,
 )
+from ....common import retry_if, with_retry
+from ....common._retry import LoopExceeded
 from ....testtools import AsyncTestCase, async_runner
 
 from .._logging import (
@@ -47,14 +51,120 @@ from ..testtools import (
 
 TIMEOUT = 5
 ONE_GIB = 1073741824
+# Fields logged when an AWS API call fails.
+_EXPECTED_AWS_ERROR_KEYS = frozenset(
+    (AWS_CODE.key, AWS_MESSAGE.key, AWS_REQUEST_ID.key)
+)
+# Codes of AWS errors caused by throttling or a transient server problem,
+# which are worth retrying.
+_RETRYABLE_AWS_ERROR_CODES = frozenset([
+    u'RequestLimitExceeded', u'Throttling', u'ServiceUnavailable',
+    u'InternalError',
+])
+# Number of volumes to detach and destroy at once when cleaning up after a
+# test.
+CLEANUP_CONCURRENCY = 8
+
+
+def _error_state(state_flow):
+    """
+    :param VolumeStateFlow state_flow: The state flow of an operation.
+
+    :returns: A state from ``VolumeStates`` that is not part of
+        ``state_flow``.
+    :rtype: ValueConstant
+    """
+    valid_states = (state_flow.start_state,
+                    state_flow.transient_state,
+                    state_flow.end_state)
+    return next(state for state in VolumeStates.iterconstants()
+                if state not in valid_states)
+
+
+# A state from ``VolumeStates`` for each ``VolumeOperations`` that will not be
+# part of a volume's states resulting from that operation.
+_ERR_STATE_FOR_OPERATION = {
+    operation: _error_state(state_flow)
+    for operation, state_flow in VOLUME_STATE_TABLE.table.items()
+}
+
+
+def _is_retryable_aws_error(exception):
+    """
+    :param Exception exception: An exception raised by an AWS API call.
+
+    :returns: ``True`` if ``exception`` reports throttling or a server error,
+        ``False`` for anything else, including other client errors.
+    """
+    if not isinstance(exception, ClientError):
+        return False
+    status = exception.response.get(
+        'ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    code = exception.response.get('Error', {}).get('Code')
+    return code in _RETRYABLE_AWS_ERROR_CODES or status >= 500
+
+
+def _retry_aws(function, base=0.2, cap=30, max_attempts=6):
+    """
+    Wrap an AWS API call so that it is retried, with full-jitter exponential
+    backoff, if it fails because of throttling or a server error.
+
+    botocore already retries ``RequestLimitExceeded`` and 5xx errors with its
+    own backoff, so this adds up to ``max_attempts`` further attempts once
+    those are exhausted.  Only wrap calls that are safe to repeat; pass a
+    ``ClientToken`` to calls such as ``create_volume`` that are not
+    otherwise idempotent.
+
+    :param callable function: The AWS API call.
+    :param float base: Ceiling of the first delay between attempts, in
+        seconds.
+    :param float cap: Maximum ceiling of any delay between attempts, in
+        seconds.
+    :param int max_attempts: Maximum number of retries.
+
+    :return: A callable taking the same arguments as ``function``.
+    """
+    return with_retry(
+        function,
+        should_retry=retry_if(_is_retryable_aws_error),
+        steps=[
+            timedelta(seconds=delay)
+            for delay in _full_jitter_backoff(base, cap, max_attempts)
+        ],
+    )
+
+
+def _delete_volume(volume):
+    """
+    Delete an EBS volume, retrying as ``_retry_aws`` does.
+
+    ``DeleteVolume`` is not idempotent: if an attempt deletes the volume but
+    its response is lost, the retry fails because the volume is gone.  So a
+    volume that does not exist is treated as deleted.
+
+    :param boto3.resources.factory.ec2.Volume volume: The volume to delete.
+    """
+    try:
+        _retry_aws(volume.delete)()
+    except ClientError as e:
+        if e.response['Error']['Code'] != NOT_FOUND:
+            raise
 
 
 @require_backend('aws')
 def ebsblockdeviceapi_for_test(test_case):
     """
     Create an ``EBSBlockDeviceAPI`` for use by tests.
+
+    Volume state refreshes made by the test are batched, since its cleanup
+    waits on several volumes at once.
     """
-    return get_blockdeviceapi_with_cleanup(test_case)
+    test_case.patch(
+        ebs, "_DESCRIBE_VOLUMES_BATCHER", _DescribeVolumesBatcher()
+    )
+    return get_blockdeviceapi_with_cleanup(
+        test_case, cleanup_concurrency=CLEANUP_CONCURRENCY
+    )
 
 
 class EBSBlockDeviceAPIInterfaceTests(
@@ -120,7 +230,7 @@ class EBSBlockDeviceAPIInterfaceTests(
         def clean_volume(volume):
             volume.detach_from_instance()
             _wait_for_volume_state_change(VolumeOperations.DETACH, volume)
-            volume.delete()
+            _delete_volume(volume)
 
         self.addCleanup(clean_volume, volume)
 
@@ -180,15 +290,17 @@ class EBSBlockDeviceAPIInterfaceTests(
         meta_client = ec2_client.connection.meta.client
 
         # Create a volume directly using boto.
-        requested_volume = meta_client.create_volume(
-            Size=1, AvailabilityZone=ec2_client.zone)
+        # The client token makes retries of this request idempotent.
+        requested_volume = _retry_aws(meta_client.create_volume)(
+            Size=1, AvailabilityZone=ec2_client.zone,
+            ClientToken=unicode(uuid4()))
         created_volume = ec2_client.connection.Volume(
             requested_volume['VolumeId'])
 
         def clean_volume(volume):
             volume.detach_from_instance()
             _wait_for_volume_state_change(VolumeOperations.DETACH, volume)
-            volume.delete()
+            _delete_volume(volume)
 
         self.addCleanup(clean_volume, created_volume)
 
@@ -228,12 +340,14 @@ class EBSBlockDeviceAPIInterfaceTests(
             self.skipTest(str(e))
         ec2_client = get_ec2_client_for_test(config)
         meta_client = ec2_client.connection.meta.client
-        requested_volume = meta_client.create_volume(
+        # The client token makes retries of this request idempotent.
+        requested_volume = _retry_aws(meta_client.create_volume)(
             Size=int(Byte(self.minimum_allocatable_size).to_GiB().value),
-            AvailabilityZone=ec2_client.zone)
+            AvailabilityZone=ec2_client.zone,
+            ClientToken=unicode(uuid4()))
         created_volume = ec2_client.connection.Volume(
             requested_volume['VolumeId'])
-        self.addCleanup(created_volume.delete)
+        self.addCleanup(_delete_volume, created_volume)
 
         _wait_for_volume_state_change(VolumeOperations.CREATE,
                                       created_volume)
@@ -299,12 +413,11 @@ class EBSBlockDeviceAPIInterfaceTests(
 
         # Validate decorated method for exception logging
         # actually logged to ``Eliot`` logger.
-        expected_message_keys = {AWS_CODE.key, AWS_MESSAGE.key,
-                                 AWS_REQUEST_ID.key}
         for logged in LoggedAction.of_type(logger.messages, AWS_ACTION,):
-            key_subset = set(key for key in expected_message_keys
-                             if key in logged.end_message.keys())
-            self.assertEqual(expected_message_keys, key_subset)
+            self.assertEqual(
+                _EXPECTED_AWS_ERROR_KEYS,
+                _EXPECTED_AWS_ERROR_KEYS.intersection(logged.end_message),
+            )
 
     @capture_logging(None)
     def test_boto_request_logging(self, logger):
@@ -314,12 +427,10 @@ class EBSBlockDeviceAPIInterfaceTests(
         """
         self.api.list_volumes()
 
-        messages = list(
-            message
-            for message
-            in logger.messages
+        messages = [
+            message for message in logger.messages
             if message.get("message_type") == BOTO_LOG_HEADER
-        )
+        ]
         self.assertNotEqual(
             [], messages,
             "Didn't find Boto messages in logged messages {}".format(
@@ -402,11 +513,11 @@ class EBSBlockDeviceAPIInterfaceTests(
 
         cannonical_profile = MandatoryProfiles.lookupByValue(
             created_profile.value)
-        A = EBSMandatoryProfileAttributes.lookupByName(
+        attributes = EBSMandatoryProfileAttributes.lookupByName(
             cannonical_profile.name).value
         ebs_volume = self.api._get_ebs_volume(volume1.blockdevice_id)
-        self.assertEqual(ebs_volume.volume_type, A.volume_type.value)
-        requested_iops = A.requested_iops(ebs_volume.size)
+        self.assertEqual(ebs_volume.volume_type, attributes.volume_type.value)
+        requested_iops = attributes.requested_iops(ebs_volume.size)
         self.assertEqual(ebs_volume.iops if requested_iops is not None
                          else None, requested_iops)
 
@@ -467,31 +578,55 @@ class VolumeStub(object):
         return not self.__eq__(other)
 
 
+class VolumeEndStateTypes(Names):
+    """
+    Types of volume states to simulate.
+    """
+    ERROR_STATE = NamedConstant()
+    TRANSIT_STATE = NamedConstant()
+    DESTINATION_STATE = NamedConstant()
+
+
+class VolumeAttachDataTypes(Names):
+    """
+    Types of volume's attach data states to simulate.
+    """
+    MISSING_ATTACH_DATA = NamedConstant()
+    MISSING_INSTANCE_ID = NamedConstant()
+    MISSING_DEVICE = NamedConstant()
+    ATTACH_SUCCESS = NamedConstant()
+    DETACH_SUCCESS = NamedConstant()
+
+
+V = VolumeOperations
+S = VolumeEndStateTypes
+A = VolumeAttachDataTypes
+
+
 class VolumeStateTransitionTests(AsyncTestCase):
     """
     Tests for volume state operations and resulting volume state changes.
     """
-    class VolumeEndStateTypes(Names):
-        """
-        Types of volume states to simulate.
-        """
-        ERROR_STATE = NamedConstant()
-        TRANSIT_STATE = NamedConstant()
-        DESTINATION_STATE = NamedConstant()
 
-    class VolumeAttachDataTypes(Names):
-        """
-        Types of volume's attach data states to simulate.
-        """
-        MISSING_ATTACH_DATA = NamedConstant()
-        MISSING_INSTANCE_ID = NamedConstant()
-        MISSING_DEVICE = NamedConstant()
-        ATTACH_SUCCESS = NamedConstant()
-        DETACH_SUCCESS = NamedConstant()
-
-    V = VolumeOperations
-    S = VolumeEndStateTypes
-    A = VolumeAttachDataTypes
+    # Irrelevant volume attributes of template volumes.
+    _TEMPLATE_VOLUME_FIELDS = dict(
+        id=u'vol-9c48a689',
+        create_time=u'2015-07-14T22:46:00.447Z',
+        size=1,
+        snapshot_id='',
+        zone=u'us-west-2b',
+        type=u'standard',
+    )
+
+    # Callables creating fresh volume attach data for each attach data type.
+    _ATTACH_DATA_FACTORIES = {
+        A.MISSING_ATTACH_DATA: lambda: None,
+        A.MISSING_INSTANCE_ID: lambda: dict(Device=u'/dev/sdf', InstanceId=''),
+        A.MISSING_DEVICE: lambda: dict(Device='', InstanceId=u'i-xyz'),
+        A.ATTACH_SUCCESS: lambda: dict(Device=u'/dev/sdf',
+                                       InstanceId=u'i-xyz'),
+        A.DETACH_SUCCESS: lambda: None,
+    }
 
     def _create_template_ebs_volume(self, operation):
         """
@@ -504,17 +639,9 @@ class VolumeStateTransitionTests(AsyncTestCase):
         :rtype: ``VolumeStub``
         """
         volume = VolumeStub()
+        volume.__dict__.update(self._TEMPLATE_VOLUME_FIELDS)
 
-        # Irrelevant volume attributes.
-        volume.id = u'vol-9c48a689'
-        volume.create_time = u'2015-07-14T22:46:00.447Z'
-        volume.size = 1
-        volume.snapshot_id = ''
-        volume.zone = u'us-west-2b'
-        volume.type = u'standard'
-
-        volume_state_table = VolumeStateTable()
-        state_flow = volume_state_table.table[operation]
+        state_flow = VOLUME_STATE_TABLE.table[operation]
         start_state = state_flow.start_state.value
 
         # Interesting volume attribute.
@@ -535,20 +662,13 @@ class VolumeStateTransitionTests(AsyncTestCase):
             a volume's states resulting from input operation.
         :rtype: ValueConstant
         """
-        volume_state_table = VolumeStateTable()
-        state_flow = volume_state_table.table[operation]
-
-        if state_type == self.S.ERROR_STATE:
-            valid_states = set([state_flow.start_state,
-                                state_flow.transient_state,
-                                state_flow.end_state])
+        state_flow = VOLUME_STATE_TABLE.table[operation]
 
-            err_states = set(VolumeStates._enumerants.values()) - valid_states
-            err_state = err_states.pop()
-            return err_state.value
-        elif state_type == self.S.TRANSIT_STATE:
+        if state_type == S.ERROR_STATE:
+            return _ERR_STATE_FOR_OPERATION[operation].value
+        elif state_type == S.TRANSIT_STATE:
             return state_flow.transient_state.value
-        elif state_type == self.S.DESTINATION_STATE:
+        elif state_type == S.DESTINATION_STATE:
             return state_flow.end_state.value
 
     def _pick_attach_data(self, attach_type):
@@ -560,25 +680,7 @@ class VolumeStateTransitionTests(AsyncTestCase):
         :returns: Volume attachment set that conforms to requested attach type.
         :rtype: `dict`
         """
-        if attach_type == self.A.MISSING_ATTACH_DATA:
-            return None
-        elif attach_type == self.A.MISSING_INSTANCE_ID:
-            attach_data = dict()
-            attach_data['Device'] = u'/dev/sdf'
-            attach_data['InstanceId'] = ''
-            return attach_data
-        elif attach_type == self.A.MISSING_DEVICE:
-            attach_data = dict()
-            attach_data['Device'] = ''
-            attach_data['InstanceId'] = u'i-xyz'
-            return attach_data
-        elif attach_type == self.A.ATTACH_SUCCESS:
-            attach_data = dict()
-            attach_data['Device'] = u'/dev/sdf'
-            attach_data['InstanceId'] = u'i-xyz'
-            return attach_data
-        elif attach_type == self.A.DETACH_SUCCESS:
-            return None
+        return self._ATTACH_DATA_FACTORIES[attach_type]()
 
     def _custom_update(self, operation, state_type,
                        attach_data=A.MISSING_ATTACH_DATA):
@@ -596,6 +698,17 @@ class VolumeStateTransitionTests(AsyncTestCase):
             volume.attachments = [self._pick_attach_data(attach_data)]
         return update
 
+    def _case_message(self, operation, volume_end_state_type,
+                      attach_data_type):
+        """
+        Describe a volume state change case, to identify it in the failure
+        message of a test that checks several cases.
+        """
+        return u"operation {}, end state {}, attach data {}".format(
+            operation.name, volume_end_state_type.name,
+            attach_data_type.name,
+        )
+
     def _assert_unexpected_state_exception(self, operation,
                                            volume_end_state_type,
                                            attach_type=A.MISSING_ATTACH_DATA):
@@ -606,8 +719,11 @@ class VolumeStateTransitionTests(AsyncTestCase):
         volume = self._create_template_ebs_volume(operation)
         update = self._custom_update(operation, volume_end_state_type,
                                      attach_type)
-        self.assertRaises(UnexpectedStateException, _reached_end_state,
-                          operation, volume, update, 0, TIMEOUT)
+        self.assertThat(
+            lambda: _reached_end_state(operation, volume, update, 0, TIMEOUT),
+            raises(UnexpectedStateException),
+            self._case_message(operation, volume_end_state_type, attach_type),
+        )
 
     def _assert_fail(self, operation, volume_end_state_type,
                      attach_data_type=A.MISSING_ATTACH_DATA):
@@ -619,7 +735,11 @@ class VolumeStateTransitionTests(AsyncTestCase):
         update = self._custom_update(operation, volume_end_state_type,
                                      attach_data_type)
         finish_result = _reached_end_state(operation, volume, update, 0)
-        self.assertEqual(False, finish_result)
+        self.assertEqual(
+            False, finish_result,
+            self._case_message(operation, volume_end_state_type,
+                               attach_data_type),
+        )
 
     def _assert_timeout(self, operation, testcase,
                         attach_data_type=A.MISSING_ATTACH_DATA):
@@ -643,111 +763,75 @@ class VolumeStateTransitionTests(AsyncTestCase):
         _wait_for_volume_state_change(operation, volume,
                                       self._custom_update(operation, testcase,
                                                           attach_data_type),
-                                      TIMEOUT)
+                                      TIMEOUT, base=0.05, cap=0.5)
         return volume
 
-    def test_create_invalid_state(self):
+    def test_invalid_state(self):
         """
-        Assert that error volume state during creation raises
+        Assert that error volume state during any operation raises
         ``UnexpectedStateException``.
         """
-        self._assert_unexpected_state_exception(self.V.CREATE,
-                                                self.S.ERROR_STATE)
+        for operation in V.iterconstants():
+            self._assert_unexpected_state_exception(operation,
+                                                    S.ERROR_STATE)
 
-    def test_destroy_invalid_state(self):
+    def test_stuck(self):
         """
-        Assert that error volume state during destroy raises
-        ``UnexpectedStateException``.
-        """
-        self._assert_unexpected_state_exception(self.V.DESTROY,
-                                                self.S.ERROR_STATE)
-
-    def test_attach_invalid_state(self):
+        Assert that stuck transient state during any operation indicates
+        operation in progress.
         """
-        Assert that error volume state during attach raises
-        ``UnexpectedStateException``.
-        """
-        self._assert_unexpected_state_exception(self.V.ATTACH,
-                                                self.S.ERROR_STATE)
+        for operation in V.iterconstants():
+            self._assert_fail(operation, S.TRANSIT_STATE)
 
-    def test_detach_invalid_state(self):
+    def test_attach_incomplete_attach_data(self):
         """
-        Assert that error volume state during detach raises
-        ``UnexpectedStateException``.
+        Assert that missing attach data, attach instance id, or attached
+        device name indicates attach in progress.
         """
-        self._assert_unexpected_state_exception(self.V.DETACH,
-                                                self.S.ERROR_STATE)
-
-    def test_stuck_create(self):
-        """
-        Assert that stuck create state indicates operation in progress.
-        """
-        self._assert_fail(self.V.CREATE, self.S.TRANSIT_STATE)
-
-    def test_stuck_destroy(self):
-        """
-        Assert that stuck destroy state indicates operation in progress.
-        """
-        self._assert_fail(self.V.DESTROY, self.S.TRANSIT_STATE)
-
-    def test_stuck_attach(self):
-        """
-        Assert that stuck attach state indicates operation in progress.
-        """
-        self._assert_fail(self.V.ATTACH, self.S.TRANSIT_STATE)
-
-    def test_stuck_detach(self):
-        """
-        Assert that stuck detach state indicates operation in progress.
-        """
-        self._assert_fail(self.V.DETACH, self.S.TRANSIT_STATE)
-
-    def test_attach_missing_attach_data(self):
-        """
-        Assert that missing attach data indicates attach in progress.
-        """
-        self._assert_fail(self.V.ATTACH, self.S.DESTINATION_STATE)
-
-    def test_attach_missing_instance_id(self):
-        """
-        Assert that missing attach instance id indicates attach in progress.
-        """
-        self._assert_fail(self.V.ATTACH, self.S.DESTINATION_STATE,
-                          self.A.MISSING_INSTANCE_ID)
-
-    def test_attach_missing_device(self):
-        """
-        Assert that missing attached device name indicates attach in progress.
-        """
-        self._assert_fail(self.V.ATTACH, self.S.DESTINATION_STATE,
-                          self.A.MISSING_DEVICE)
+        for attach_data_type in [A.MISSING_ATTACH_DATA,
+                                 A.MISSING_INSTANCE_ID,
+                                 A.MISSING_DEVICE]:
+            self._assert_fail(V.ATTACH, S.DESTINATION_STATE,
+                              attach_data_type)
 
     def test_timeout(self):
         """
         Assert that ``TimeoutException`` is thrown if volume state transition
         takes longer than configured timeout.
         """
-        self._assert_timeout(self.V.ATTACH, self.S.DESTINATION_STATE)
+        self._assert_timeout(V.ATTACH, S.DESTINATION_STATE)
+
+    def test_max_attempts(self):
+        """
+        Assert that ``LoopExceeded`` is raised if a volume is still in
+        transition after ``max_attempts`` further state checks.
+        """
+        volume = self._create_template_ebs_volume(V.CREATE)
+        self.assertRaises(
+            LoopExceeded, _wait_for_volume_state_change,
+            V.CREATE, volume, self._custom_update(V.CREATE, S.TRANSIT_STATE),
+            TIMEOUT, base=0.05, cap=0.5, max_attempts=3,
+        )
 
     def test_create_success(self):
         """
         Assert that successful volume creation leads to valid volume end state.
         """
-        volume = self._process_volume(self.V.CREATE, self.S.DESTINATION_STATE)
+        volume = self._process_volume(V.CREATE, S.DESTINATION_STATE)
         self.assertEqual(volume.state, u'available')
 
     def test_destroy_success(self):
         """
         Assert that successful volume destruction leads to valid end state.
         """
-        volume = self._process_volume(self.V.DESTROY, self.S.DESTINATION_STATE)
+        volume = self._process_volume(V.DESTROY, S.DESTINATION_STATE)
         self.assertEquals(volume.state, u'')
 
     def test_attach_success(self):
         """
         Test if successful attach volume operation leads to expected state.
         """
-        volume = self._process_volume(self.V.ATTACH, self.S.DESTINATION_STATE)
+        volume = self._process_volume(V.ATTACH, S.DESTINATION_STATE)
         self.assertEqual([volume.state, volume.attachments[0]['Device'],
                           volume.attachments[0]['InstanceId']],
                          [u'in-use', u'/dev/sdf', u'i-xyz'])
@@ -756,8 +840,8 @@ class VolumeStateTransitionTests(AsyncTestCase):
         """
         Test if successful detach volume operation leads to expected state.
         """
-        volume = self._process_volume(self.V.DETACH, self.S.DESTINATION_STATE,
-                                      self.A.DETACH_SUCCESS)
+        volume = self._process_volume(V.DETACH, S.DESTINATION_STATE,
+                                      A.DETACH_SUCCESS)
         self.assertEqual(volume.state, u'available')
 
 
@@ -105,7 +105,7 @@ from ...testtools import (
 )
 from ....testtools import (
     REALISTIC_BLOCKDEVICE_SIZE, run_process, make_with_init_tests, random_name,
-    TestCase,
+    TestCase, CustomException,
 )
 from ....control import (
     Dataset, Manifestation, Node, NodeState, Deployment, DeploymentState,
@@ -5004,3 +5004,66 @@ class LogListVolumesTest(TestCase):
 
         result = wrapped(3, 5, z=7)
         self.assertEqual(result, (3, 5, 7))
+
+
+class DetachDestroyVolumesTests(TestCase):
+    """
+    Tests for ``detach_destroy_volumes``.
+    """
+    def test_concurrent(self):
+        """
+        With ``concurrency`` greater than one, all volumes, attached or not,
+        are detached and destroyed.
+        """
+        api = loopbackblockdeviceapi_for_test(self)
+        volumes = [
+            api.create_volume(
+                dataset_id=uuid4(), size=LOOPBACK_MINIMUM_ALLOCATABLE_SIZE,
+            )
+            for _ in range(3)
+        ]
+        api.attach_volume(
+            volumes[0].blockdevice_id, attach_to=api.compute_instance_id(),
+        )
+        detach_destroy_volumes(api, concurrency=3)
+        self.assertEqual([], api.list_volumes())
+
+    @capture_logging(None)
+    def test_concurrent_failure_logged_in_action(self, logger):
+        """
+        With ``concurrency`` greater than one, failures to destroy a volume
+        are logged within the cleanup action.
+        """
+        volumes = [
+            BlockDeviceVolume(
+                blockdevice_id=unicode(i), size=REALISTIC_BLOCKDEVICE_SIZE,
+                dataset_id=uuid4(),
+            )
+            for i in range(2)
+        ]
+        failures = [volumes[0].blockdevice_id]
+
+        class FailOnceAPI(object):
+            def list_volumes(self):
+                return list(volumes)
+
+            def destroy_volume(self, blockdevice_id):
+                if blockdevice_id in failures:
+                    failures.remove(blockdevice_id)
+                    raise CustomException("Fake failure generated by test")
+                volumes[:] = [
+                    volume for volume in volumes
+                    if volume.blockdevice_id != blockdevice_id
+                ]
+
+        detach_destroy_volumes(FailOnceAPI(), concurrency=2)
+
+        self.assertEqual([], volumes)
+        [traceback] = logger.flush_tracebacks(CustomException)
+        [action_start] = [
+            message for message in logger.messages
+            if message.get("action_type") ==
+            u"agent:blockdevice:cleanup:details"
+            and message.get("action_status") == u"started"
+        ]
+        self.assertEqual(action_start["task_uuid"], traceback["task_uuid"])
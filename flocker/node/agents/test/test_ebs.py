@@ -4,9 +4,12 @@
 Tests for ``flocker.node.agents.ebs``.
 """
 
+from itertools import islice
 from string import ascii_lowercase
+from threading import Event, Thread
 from uuid import uuid4
 
+from botocore.exceptions import ClientError
 from botocore.session import get_session as botocore_get_session
 from botocore.stub import Stubber
 from boto3.session import Session as Boto3Session
@@ -25,7 +28,8 @@ from ..ebs import (
     _attach_volume_and_wait_for_device, _get_blockdevices,
     _get_device_size, _wait_for_new_device, _find_allocated_devices,
     _select_free_device, NoAvailableDevice,
-    _is_cluster_volume, CLUSTER_ID_LABEL
+    _is_cluster_volume, CLUSTER_ID_LABEL, _full_jitter_backoff,
+    _DescribeVolumesBatcher, NOT_FOUND,
 )
 from .._logging import NO_NEW_DEVICE_IN_OS, INVALID_FLOCKER_CLUSTER_ID
 from ..blockdevice import BlockDeviceVolume
@@ -257,6 +261,39 @@ class WaitForNewDeviceTests(TestCase):
         )
 
 
+class FullJitterBackoffTests(TestCase):
+    """
+    Tests for ``_full_jitter_backoff``.
+    """
+    def test_max_attempts(self):
+        """
+        Exactly ``max_attempts`` delays are generated.
+        """
+        self.assertEqual(
+            5, len(list(_full_jitter_backoff(0.1, 1.0, max_attempts=5)))
+        )
+
+    def test_bounded_by_exponential_ceiling(self):
+        """
+        Each delay is between zero and ``base`` doubled once per attempt,
+        never exceeding ``cap``.
+        """
+        delays = list(_full_jitter_backoff(0.1, 1.0, max_attempts=10))
+        ceilings = [min(1.0, 0.1 * 2 ** attempt) for attempt in range(10)]
+        self.assertTrue(
+            all(0 <= delay <= ceiling
+                for delay, ceiling in zip(delays, ceilings)),
+            (delays, ceilings),
+        )
+
+    def test_unlimited(self):
+        """
+        If ``max_attempts`` is ``None``, delays are generated indefinitely.
+        """
+        delays = _full_jitter_backoff(0.1, 1.0)
+        self.assertEqual(1000, len(list(islice(delays, 1000))))
+
+
 class FindAllocatedDeviceTests(TestCase):
     """
     Tests for finding allocated devices.
@@ -293,9 +330,12 @@ class SelectFreeDeviceTests(TestCase):
         self.assertRaises(NoAvailableDevice, _select_free_device, existing)
 
 
-def boto_volume_for_test(test, cluster_id):
+def stubbed_ec2_for_test():
     """
-    Create an in-memory boto3 Volume, avoiding any AWS API calls.
+    Create an in-memory boto3 EC2 resource whose API calls are answered by a
+    botocore ``Stubber``.
+
+    :returns: A two-tuple of the EC2 resource and its activated ``Stubber``.
     """
     # Create a session directly rather than allow lazy loading of a default
     # session.
@@ -306,9 +346,17 @@ def boto_volume_for_test(test, cluster_id):
     )
     ec2 = s.resource("ec2", region_name=region_name)
     stubber = Stubber(ec2.meta.client)
-    # From this point, any attempt to interact with AWS API should fail with
-    # botocore.exceptions.StubResponseError
+    # From this point, any attempt to interact with AWS API without a stubbed
+    # response should fail with botocore.exceptions.StubResponseError
     stubber.activate()
+    return ec2, stubber
+
+
+def boto_volume_for_test(test, cluster_id):
+    """
+    Create an in-memory boto3 Volume, avoiding any AWS API calls.
+    """
+    ec2, _ = stubbed_ec2_for_test()
     volume_id = u"vol-{}".format(random_name(test))
     v = ec2.Volume(id=volume_id)
     tags = []
@@ -390,3 +438,177 @@ class IsClusterVolumeTests(TestCase):
                 )
             )
         )
+
+
+class DescribeVolumesBatcherTests(TestCase):
+    """
+    Tests for ``_DescribeVolumesBatcher``.
+    """
+    def setUp(self):
+        super(DescribeVolumesBatcherTests, self).setUp()
+        self.ec2, self.stubber = stubbed_ec2_for_test()
+
+    def test_describe(self):
+        """
+        ``describe`` returns the ``DescribeVolumes`` data for the volume.
+        """
+        volume = self.ec2.Volume(id=u"vol-00000001")
+        data = dict(VolumeId=volume.id, State=u"available")
+        self.stubber.add_response(
+            "describe_volumes",
+            dict(Volumes=[data]),
+            dict(Filters=[dict(Name="volume-id", Values=[volume.id])]),
+        )
+        batcher = _DescribeVolumesBatcher(sleep=lambda delay: None)
+        self.assertEqual(data, batcher.describe(volume))
+
+    def test_missing_volume(self):
+        """
+        ``describe`` raises ``ClientError`` with the ``NOT_FOUND`` code if the
+        volume does not exist.
+        """
+        volume = self.ec2.Volume(id=u"vol-00000001")
+        self.stubber.add_response("describe_volumes", dict(Volumes=[]))
+        batcher = _DescribeVolumesBatcher(sleep=lambda delay: None)
+        exception = self.assertRaises(
+            ClientError, batcher.describe, volume
+        )
+        self.assertEqual(NOT_FOUND, exception.response["Error"]["Code"])
+
+    def test_alone_not_delayed(self):
+        """
+        If no other lookups are in progress, ``describe`` makes its request
+        without waiting for others to join it.
+        """
+        volume = self.ec2.Volume(id=u"vol-00000001")
+        data = dict(VolumeId=volume.id, State=u"available")
+        self.stubber.add_response("describe_volumes", dict(Volumes=[data]))
+        delays = []
+        batcher = _DescribeVolumesBatcher(sleep=delays.append)
+        batcher.describe(volume)
+        self.assertEqual([], delays)
+
+    def _batcher_with_follower(self, follower, fail=False):
+        """
+        Create a batcher for ``self.ec2`` with a lookup already in progress
+        from another thread, which holds open the batches of later lookups.
+        While a batch is held open, a lookup of ``follower`` from another
+        thread joins it.
+
+        :param bool fail: If ``True``, holding open the batch raises
+            ``CustomException`` once the follower has had time to join.
+
+        :returns: A three-tuple of the batcher, a ``dict`` mapping volume
+            identifiers to the results of the lookups from other threads and
+            a callable which allows those lookups to finish and waits for
+            them.
+        """
+        client = self.ec2.meta.client
+        describe_volumes = client.describe_volumes
+        started = Event()
+        release = Event()
+
+        def blocking_describe_volumes(**kwargs):
+            # Hold up the first request until ``finish`` is called.
+            if not started.is_set():
+                started.set()
+                release.wait(10)
+            return describe_volumes(**kwargs)
+        self.patch(client, "describe_volumes", blocking_describe_volumes)
+        in_progress = self.ec2.Volume(id=u"vol-00000000")
+        results = {}
+        threads = []
+
+        def lookup(volume):
+            def describe():
+                results[volume.id] = batcher.describe(volume)
+            thread = Thread(target=describe)
+            # Don't let a lookup stuck by a regression keep trial running.
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        def sleep(delay):
+            lookup(follower)
+            # The follower cannot finish before this batch is looked up, so
+            # this only gives it time to join.
+            threads[-1].join(1)
+            if fail:
+                raise CustomException("Fake failure generated by test")
+
+        def finish():
+            release.set()
+            for thread in threads:
+                thread.join(10)
+                self.assertFalse(thread.is_alive(), "Lookup did not finish.")
+
+        batcher = _DescribeVolumesBatcher(sleep=sleep)
+        lookup(in_progress)
+        self.assertTrue(started.wait(10))
+        return batcher, results, finish
+
+    def _coalesced_volumes(self):
+        """
+        Stub the ``DescribeVolumes`` requests made by lookups of two volumes
+        with ``_batcher_with_follower``: one for both volumes, then one for
+        the lookup already in progress.
+
+        :returns: A two-tuple of ``(volume, data)`` pairs for the two
+            volumes, and the data for the volume whose lookup was in
+            progress.
+        """
+        volume_1 = self.ec2.Volume(id=u"vol-00000001")
+        volume_2 = self.ec2.Volume(id=u"vol-00000002")
+        data_0 = dict(VolumeId=u"vol-00000000", State=u"creating")
+        data_1 = dict(VolumeId=volume_1.id, State=u"available")
+        data_2 = dict(VolumeId=volume_2.id, State=u"in-use")
+        self.stubber.add_response(
+            "describe_volumes",
+            dict(Volumes=[data_1, data_2]),
+            dict(Filters=[
+                dict(Name="volume-id", Values=[volume_1.id, volume_2.id]),
+            ]),
+        )
+        self.stubber.add_response("describe_volumes", dict(Volumes=[data_0]))
+        return [(volume_1, data_1), (volume_2, data_2)], data_0
+
+    def test_coalesced(self):
+        """
+        Volumes looked up while a batch is waiting are described by the same
+        ``DescribeVolumes`` request.
+        """
+        volumes, data_0 = self._coalesced_volumes()
+        [(volume_1, data_1), (volume_2, data_2)] = volumes
+        batcher, results, finish = self._batcher_with_follower(volume_2)
+        try:
+            self.assertEqual(data_1, batcher.describe(volume_1))
+        finally:
+            finish()
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(
+            {data_0["VolumeId"]: data_0, volume_2.id: data_2}, results,
+        )
+
+    def test_wait_failure_releases_batch(self):
+        """
+        If waiting for lookups to join a batch fails, the batch is still
+        looked up and closed, so neither lookups that joined it nor later
+        lookups hang.
+        """
+        volumes, data_0 = self._coalesced_volumes()
+        [(volume_1, data_1), (volume_2, data_2)] = volumes
+        self.stubber.add_response("describe_volumes", dict(Volumes=[data_1]))
+        batcher, results, finish = self._batcher_with_follower(
+            volume_2, fail=True,
+        )
+        try:
+            self.assertRaises(CustomException, batcher.describe, volume_1)
+        finally:
+            finish()
+        self.assertEqual(
+            {data_0["VolumeId"]: data_0, volume_2.id: data_2}, results,
+        )
+        # With no other lookups in progress this does not wait, so it does
+        # not fail.
+        self.assertEqual(data_1, batcher.describe(volume_1))
+        self.stubber.assert_no_pending_responses()
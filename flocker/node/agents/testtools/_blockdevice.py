@@ -4,6 +4,7 @@
 Test helpers for ``flocker.node.agents.blockdevice``.
 """
 from functools import wraps
+from multiprocessing.pool import ThreadPool
 from os import environ
 from unittest import SkipTest, skipUnless
 from subprocess import check_output, Popen, PIPE, STDOUT
@@ -60,7 +61,19 @@ _logger = Logger()
 CLEANUP_RETRY_LIMIT = 10
 
 
-def detach_destroy_volumes(api):
+def _detach_destroy_volume(api, volume):
+    """
+    Detach and destroy a volume, logging rather than raising any failure.
+    """
+    try:
+        if volume.attached_to is not None:
+            api.detach_volume(volume.blockdevice_id)
+        api.destroy_volume(volume.blockdevice_id)
+    except:
+        write_traceback(_logger)
+
+
+def detach_destroy_volumes(api, concurrency=1):
     """
     Detach and destroy all volumes known to this API.
     If we failed to detach a volume for any reason,
@@ -68,19 +81,31 @@ def detach_destroy_volumes(api):
     This is to facilitate best effort cleanup of volume
     environment after each test run, so that future runs
     are not impacted.
+
+    :param int concurrency: The number of volumes to detach and destroy at
+        once, so that slow backends can wait for several at a time.
     """
     volumes = api.list_volumes()
     retry = 0
     action_type = u"agent:blockdevice:cleanup:details"
-    with start_action(action_type=action_type):
+    with start_action(action_type=action_type) as action:
+        def detach_destroy_in_action(volume):
+            # Eliot's action context is per-thread, so log from pool threads
+            # within the cleanup action explicitly.
+            with action.context():
+                _detach_destroy_volume(api, volume)
+
         while retry < CLEANUP_RETRY_LIMIT and len(volumes) > 0:
-            for volume in volumes:
+            if concurrency > 1 and len(volumes) > 1:
+                pool = ThreadPool(min(concurrency, len(volumes)))
                 try:
-                    if volume.attached_to is not None:
-                        api.detach_volume(volume.blockdevice_id)
-                    api.destroy_volume(volume.blockdevice_id)
-                except:
-                    write_traceback(_logger)
+                    pool.map(detach_destroy_in_action, volumes)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                for volume in volumes:
+                    _detach_destroy_volume(api, volume)
 
             time.sleep(1.0)
             volumes = api.list_volumes()
@@ -1007,13 +1032,15 @@ def get_ec2_client_for_test(config):
     )
 
 
-def get_blockdeviceapi_with_cleanup(test_case):
+def get_blockdeviceapi_with_cleanup(test_case, cleanup_concurrency=1):
     """
     Instantiate an ``IBlockDeviceAPI`` implementation configured to work in the
     current environment.  Arrange for all volumes created by it to be cleaned
     up at the end of the current test run.
 
     :param TestCase test_case: The running test.
+    :param int cleanup_concurrency: The number of volumes to clean up at
+        once.  See ``detach_destroy_volumes``.
     :raises: ``SkipTest`` if either:
         1) A ``FLOCKER_FUNCTIONAL_TEST_CLOUD_CONFIG_FILE``
         was not set and the default config file could not be read, or,
@@ -1025,7 +1052,9 @@ def get_blockdeviceapi_with_cleanup(test_case):
         api = get_blockdeviceapi()
     except InvalidConfig as e:
         raise SkipTest(str(e))
-    test_case.addCleanup(detach_destroy_volumes, api)
+    test_case.addCleanup(
+        detach_destroy_volumes, api, concurrency=cleanup_concurrency
+    )
     return api
 
 
@@ -33,6 +33,31 @@ from effect import (
 )
 
 
+# Source file of each task function (and of the ``_tasks`` module), found
+# once per build rather than once per directive.
+_SOURCEFILE_CACHE = {}
+
+
+# Commands rendered for each task name and its arguments.  Lets a task used by
+# several documents run only once per build.  Sphinx does not re-import the
+# tasks during a build, so there is nothing newer to render until the next
+# build process starts with an empty cache.
+_RENDER_CACHE = {}
+
+
+def _sourcefile(obj):
+    """
+    Return the name of the file in which ``obj`` is defined.
+
+    :param obj: A module or function.
+    :return: The result of ``inspect.getsourcefile`` for ``obj``.
+    """
+    try:
+        return _SOURCEFILE_CACHE[obj]
+    except KeyError:
+        return _SOURCEFILE_CACHE.setdefault(obj, getsourcefile(obj))
+
+
 def run_for_docs(effect):
 
     commands = []
@@ -104,35 +129,37 @@ class TaskDirective(Directive):
         else:
             task_arguments = []
 
-        commands = task(*task_arguments)
-        lines = ['.. prompt:: bash %s,> auto' % (prompt,), '']
+        cache_key = (self.arguments[0], tuple(task_arguments))
+        command_lines = _RENDER_CACHE.get(cache_key)
+        if command_lines is None:
+            commands = task(*task_arguments)
+            try:
+                command_lines = run_for_docs(commands)
+            except NoPerformerFoundError as e:
+                raise self.error("task: %s not supported"
+                                 % (type(e.args[0]).__name__,))
+            except SequenceFailed as e:
+                raise self.error("task: %s failed: %s"
+                                 % (self.arguments[0], e.exc_info[1]))
+            _RENDER_CACHE[cache_key] = command_lines
 
-        try:
-            command_lines = run_for_docs(commands)
-        except NoPerformerFoundError as e:
-            raise self.error("task: %s not supported"
-                             % (type(e.args[0]).__name__,))
-        except SequenceFailed as e:
-            print e.error
+        lines = ['.. prompt:: bash %s,> auto' % (prompt,), '']
 
+        command_prefix = '   ' + prompt + ' '
         for command_line in command_lines:
             # handler can return either a string or a list.  If it returns a
             # list, treat the elements after the first as continuation lines.
             if isinstance(command_line, list):
-                lines.append('   %s %s' % (prompt, command_line[0],))
-                lines.extend(['   > %s' % (line,)
-                              for line in command_line[1:]])
+                lines.append(command_prefix + command_line[0])
+                lines.extend(['   > ' + line for line in command_line[1:]])
             else:
-                lines.append('   %s %s' % (prompt, command_line,))
-
-        # The following three lines record (some?) of the dependencies of the
-        # directive, so automatic regeneration happens.  Specifically, it
-        # records this file, and the file where the task is declared.
-        task_file = getsourcefile(task)
-        tasks_file = getsourcefile(tasks)
-        self.state.document.settings.record_dependencies.add(task_file)
-        self.state.document.settings.record_dependencies.add(tasks_file)
-        self.state.document.settings.record_dependencies.add(__file__)
+                lines.append(command_prefix + command_line)
+
+        # Record (some?) of the dependencies of the directive, so automatic
+        # regeneration happens.  Specifically, it records this file, and the
+        # file where the task is declared.
+        self.state.document.settings.record_dependencies.add(
+            _sourcefile(task), _sourcefile(tasks), __file__)
 
         node = nodes.Element()
         text = StringList(lines)
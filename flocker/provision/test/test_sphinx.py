@@ -0,0 +1,42 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+
+"""
+Tests for ``flocker.provision._sphinx``.
+"""
+
+from docutils.parsers.rst import DirectiveError
+from effect import Effect, Error
+
+from flocker.provision import _tasks as tasks
+from flocker.provision._effect import sequence
+from flocker.provision._ssh import run
+from flocker.provision._sphinx import TaskDirective
+from flocker.testtools import CustomException, TestCase
+
+
+class TaskDirectiveTests(TestCase):
+    """
+    Tests for ``TaskDirective``.
+    """
+    def test_failed_sequence(self):
+        """
+        If the effects of a task fail, ``TaskDirective.run`` raises a
+        directive error naming the task and describing the failure.
+        """
+        self.patch(
+            tasks, "task_failing_for_test",
+            lambda: sequence([
+                run("true"),
+                Effect(Error(CustomException("Fake failure"))),
+            ]),
+        )
+        directive = TaskDirective(
+            name="task", arguments=["failing_for_test"], options={},
+            content=[], lineno=1, content_offset=0, block_text="",
+            state=None, state_machine=None,
+        )
+        exception = self.assertRaises(DirectiveError, directive.run)
+        self.assertEqual(
+            "task: failing_for_test failed: Fake failure",
+            exception.msg,
+        )